@@ -1,8 +1,31 @@
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
 
+_REQUIRED_VARS = (
+    'TELEGRAM_BOT_TOKEN',
+    'SUPABASE_URL',
+    'SUPABASE_KEY',
+    'OPENAI_API_KEY'
+)
+
+# Optional URLs that are validated unless they still hold a placeholder value
+_OPTIONAL_URL_VARS = (
+    'WEBAPP_URL',
+    'CALENDLY_LINK',
+    'STRIPE_PAYMENT_LINK'
+)
+
+_URL_PATTERN = re.compile(
+    r'^https?://'  # http:// or https://
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'  # domain...
+    r'localhost|'  # localhost...
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # ...or ip
+    r'(?::\d+)?'  # optional port
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+
 class Config:
     TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
     TELEGRAM_ADMIN_ID = int(os.getenv('TELEGRAM_ADMIN_ID', '0'))
@@ -26,44 +49,19 @@ class Config:
     
     @classmethod
     def validate(cls):
-        required_vars = [
-            'TELEGRAM_BOT_TOKEN',
-            'SUPABASE_URL',
-            'SUPABASE_KEY',
-            'OPENAI_API_KEY'
-        ]
-        
-        missing_vars = []
-        for var in required_vars:
-            if not getattr(cls, var):
-                missing_vars.append(var)
+        missing_vars = [var for var in _REQUIRED_VARS if not getattr(cls, var)]
         
         if missing_vars:
             raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
         
-        # Validate URL formats
-        import re
-        url_pattern = re.compile(
-            r'^https?://'  # http:// or https://
-            r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'  # domain...
-            r'localhost|'  # localhost...
-            r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # ...or ip
-            r'(?::\d+)?'  # optional port
-            r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-        
         # Validate SUPABASE_URL
-        if cls.SUPABASE_URL and not url_pattern.match(cls.SUPABASE_URL):
+        if cls.SUPABASE_URL and not _URL_PATTERN.match(cls.SUPABASE_URL):
             raise ValueError(f"Invalid SUPABASE_URL format: '{cls.SUPABASE_URL}'. Expected format: https://your-project.supabase.co")
         
         # Validate other URLs if they're not default placeholders
-        urls_to_check = [
-            ('WEBAPP_URL', cls.WEBAPP_URL),
-            ('CALENDLY_LINK', cls.CALENDLY_LINK),
-            ('STRIPE_PAYMENT_LINK', cls.STRIPE_PAYMENT_LINK)
-        ]
-        
-        for var_name, url_value in urls_to_check:
-            if url_value and 'your-' not in url_value and not url_pattern.match(url_value):
+        for var_name in _OPTIONAL_URL_VARS:
+            url_value = getattr(cls, var_name)
+            if url_value and 'your-' not in url_value and not _URL_PATTERN.match(url_value):
                 raise ValueError(f"Invalid {var_name} format: '{url_value}'")
         
         return True
\ No newline at end of file
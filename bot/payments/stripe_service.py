@@ -1,85 +1,98 @@
 """Stripe payment service for handling payment verification and webhooks"""
 
 import logging
-import json
+import re
 import hmac
-import hashlib
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 
+import orjson
+
+# Matches the `t=` and `v1=` elements of a Stripe-Signature header
+_SIG_RE = re.compile(rb'(?:^|,)(t|v1)=([^,]+)')
+
+# A JSON document body starts with an object or array after optional whitespace
+_JSON_START_RE = re.compile(rb'\s*[{\[]')
+
+# Event types that represent a completed subscription payment
+_SUBSCRIPTION_EVENT_TYPES = frozenset({
+    'payment_intent.succeeded',
+    'invoice.payment_succeeded',
+    'checkout.session.completed'
+})
+
 class StripeService:
     """Service for handling Stripe payment operations"""
 
     def __init__(self, webhook_secret: str):
         self.webhook_secret = webhook_secret
+        self.webhook_secret_bytes = (webhook_secret or '').encode('utf-8')
+        self._enabled = bool(webhook_secret)
         self.logger = logging.getLogger(__name__)
 
     def verify_webhook_signature(self, payload: bytes, signature: str) -> bool:
         """Verify Stripe webhook signature"""
-        try:
-            if not signature:
-                self.logger.error("No signature provided")
-                return False
+        # Bail out before touching the payload when verification cannot succeed
+        if not self._enabled:
+            self.logger.error("No webhook secret configured")
+            return False
 
-            if not self.webhook_secret:
-                self.logger.error("No webhook secret configured")
-                return False
+        if not signature:
+            self.logger.error("No signature provided")
+            return False
 
+        try:
             # Parse the signature header
-            elements = signature.split(',')
             timestamp = None
             signatures = []
 
-            for element in elements:
-                key, value = element.split('=', 1)
-                if key == 't':
+            for match in _SIG_RE.finditer(signature.encode('ascii')):
+                key, value = match.groups()
+                if key == b't':
                     timestamp = value
-                elif key == 'v1':
-                    signatures.append(value)
+                else:
+                    signatures.append(value.decode('ascii'))
 
             if not timestamp or not signatures:
                 self.logger.error("Invalid signature format")
                 return False
 
-            # Create the signed payload
-            signed_payload = f"{timestamp}.{payload.decode('utf-8')}"
+            # Compute the expected signature over "<timestamp>.<payload>"
+            signed_payload = timestamp + b'.' + payload
+            expected_signature = hmac.digest(self.webhook_secret_bytes, signed_payload, 'sha256')
 
-            # Compute the expected signature
-            expected_signature = hmac.new(
-                self.webhook_secret.encode('utf-8'),
-                signed_payload.encode('utf-8'),
-                hashlib.sha256
-            ).hexdigest()
-
-            # Compare signatures
+            # Compare raw digests; v1 values are hex-encoded
             for signature_value in signatures:
-                if hmac.compare_digest(expected_signature, signature_value):
+                try:
+                    candidate = bytes.fromhex(signature_value)
+                except ValueError:
+                    continue
+                if hmac.compare_digest(expected_signature, candidate):
                     return True
 
             self.logger.error("Signature verification failed")
             return False
 
         except Exception as e:
-            self.logger.error(f"Error verifying webhook signature: {e}")
+            self.logger.error("Error verifying webhook signature: %s", e)
             return False
 
-    def parse_webhook_event(self, payload: str) -> Optional[Dict[str, Any]]:
-        """Parse Stripe webhook event payload"""
+    def parse_webhook_event(self, payload: bytes) -> Optional[Dict[str, Any]]:
+        """Parse Stripe webhook event payload from the raw request body"""
+        if not _JSON_START_RE.match(payload):
+            self.logger.error("Error parsing webhook payload: body does not look like JSON")
+            return None
+
         try:
-            event = json.loads(payload)
+            event = orjson.loads(payload)
             return event
-        except json.JSONDecodeError as e:
-            self.logger.error(f"Error parsing webhook payload: {e}")
+        except orjson.JSONDecodeError as e:
+            self.logger.error("Error parsing webhook payload: %s", e)
             return None
 
     def is_subscription_payment(self, event: Dict[str, Any]) -> bool:
         """Check if the event is a subscription payment"""
-        event_type = event.get('type', '')
-        return event_type in [
-            'payment_intent.succeeded',
-            'invoice.payment_succeeded',
-            'checkout.session.completed'
-        ]
+        return event.get('type', '') in _SUBSCRIPTION_EVENT_TYPES
 
     def extract_customer_info(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Extract customer information from webhook event"""
@@ -88,19 +101,19 @@ class StripeService:
             data = event.get('data', {})
 
             if not data or not isinstance(data, dict):
-                self.logger.warning(f"No data object in event: {event_type}")
+                self.logger.warning("No data object in event: %s", event_type)
                 return None
 
             obj = data.get('object', {})
             if not obj or not isinstance(obj, dict):
-                self.logger.warning(f"No object in data for event: {event_type}")
+                self.logger.warning("No object in data for event: %s", event_type)
                 return None
 
             if event_type == 'checkout.session.completed':
                 return {
                     'customer_id': obj.get('customer'),
                     'payment_intent': obj.get('payment_intent'),
-                    'amount_total': obj.get('amount_total', 0) / 100 if obj.get('amount_total') else 0,
+                    'amount': obj.get('amount_total', 0) / 100 if obj.get('amount_total') else 0,
                     'metadata': obj.get('metadata', {}),
                     'subscription_id': obj.get('subscription'),
                     'client_reference_id': obj.get('client_reference_id')
@@ -119,13 +132,14 @@ class StripeService:
                     'subscription_id': obj.get('subscription'),
                     'amount': obj.get('amount_paid', 0) / 100 if obj.get('amount_paid') else 0,
                     'metadata': obj.get('metadata', {}),
-                    'period_start': datetime.fromtimestamp(obj.get('period_start', 0)) if obj.get('period_start') else None,
-                    'period_end': datetime.fromtimestamp(obj.get('period_end', 0)) if obj.get('period_end') else None
+                    # Unix timestamps; convert with datetime.fromtimestamp(ts, tz=timezone.utc) where needed
+                    'period_start': obj.get('period_start'),
+                    'period_end': obj.get('period_end')
                 }
 
             return None
         except Exception as e:
-            self.logger.error(f"Error extracting customer info: {e}")
+            self.logger.error("Error extracting customer info: %s", e)
             return None
 
     def get_telegram_user_id(self, customer_info: Dict[str, Any]) -> Optional[int]:
@@ -145,7 +159,7 @@ class StripeService:
 
             return None
         except (ValueError, TypeError) as e:
-            self.logger.error(f"Error extracting telegram user ID: {e}")
+            self.logger.error("Error extracting telegram user ID: %s", e)
             return None
 
     def calculate_subscription_period(self) -> Dict[str, datetime]:
@@ -161,8 +175,9 @@ class StripeService:
     def log_payment_event(self, event_type: str, customer_info: Dict[str, Any], telegram_id: Optional[int]):
         """Log payment event for debugging"""
         self.logger.info(
-            f"Payment event: {event_type}, "
-            f"Telegram ID: {telegram_id}, "
-            f"Customer: {customer_info.get('customer_id')}, "
-            f"Amount: {customer_info.get('amount', customer_info.get('amount_total', 0))}"
+            "Payment event: %s, Telegram ID: %s, Customer: %s, Amount: %s",
+            event_type,
+            telegram_id,
+            customer_info.get('customer_id'),
+            customer_info.get('amount', 0)
         )
\ No newline at end of file
@@ -1,9 +1,13 @@
 """Webhook handler for Stripe payment notifications"""
 
+import asyncio
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Dict, Tuple
 from aiogram import Router, Bot
-from aiogram.types import Update
 from fastapi import Request, HTTPException
 from .stripe_service import StripeService
 from bot.config import Config
@@ -15,12 +19,87 @@ logger = logging.getLogger(__name__)
 # Initialize Stripe service
 stripe_service = StripeService(webhook_secret=getattr(Config, 'STRIPE_WEBHOOK_SECRET', ''))
 
+# Admin notification sent for every new subscription
+_ADMIN_TEMPLATE = """🔥 **New Subscription!**
+
+👤 **User:** {telegram_id}
+💳 **Customer ID:** {customer_id}
+💰 **Amount:** ${amount}
+🕐 **Time:** {timestamp} UTC
+
+User now has premium access! 🚀"""
+
+# Language helpers from bot.commands, resolved on first use. The commands
+# package ships with the bot itself, so importing it at module load would
+# break servers that only handle webhooks.
+_get_user_language_async = None
+_get_messages_class = None
+
+def _resolve_commands():
+    """Import the bot.commands language helpers once per process"""
+    global _get_user_language_async, _get_messages_class
+    if _get_user_language_async is None:
+        from bot.commands.commands import get_user_language_async, get_messages_class
+        _get_user_language_async = get_user_language_async
+        _get_messages_class = get_messages_class
+
+# Per-user language cache: telegram_id -> (fetched_at, language)
+LANGUAGE_CACHE_TTL = 300
+LANGUAGE_CACHE_MAX_SIZE = 1024
+_LANG_CACHE: Dict[int, Tuple[float, str]] = {}
+# Lookups in progress, so concurrent webhooks for one user share a single query
+_LANG_INFLIGHT: Dict[int, "asyncio.Task[str]"] = {}
+
+async def _fetch_language(telegram_id: int, supabase_client, ttl: float) -> str:
+    """Query the user language and store it in the cache"""
+    _resolve_commands()
+
+    # get_user_language_async only reads message.from_user.id
+    dummy_message = SimpleNamespace(from_user=SimpleNamespace(id=telegram_id))
+    language = await _get_user_language_async(dummy_message, supabase_client)
+
+    now = time.monotonic()
+    if len(_LANG_CACHE) >= LANGUAGE_CACHE_MAX_SIZE:
+        # Drop expired entries so the cache stays bounded
+        for key in [k for k, (fetched_at, _) in _LANG_CACHE.items() if now - fetched_at >= ttl]:
+            del _LANG_CACHE[key]
+        if len(_LANG_CACHE) >= LANGUAGE_CACHE_MAX_SIZE:
+            _LANG_CACHE.clear()
+
+    _LANG_CACHE[telegram_id] = (now, language)
+    return language
+
+async def _cached_language(telegram_id: int, supabase_client, ttl: float = LANGUAGE_CACHE_TTL) -> str:
+    """Get user language, reusing a recent lookup instead of querying Supabase again"""
+    cached = _LANG_CACHE.get(telegram_id)
+    if cached and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+
+    task = _LANG_INFLIGHT.get(telegram_id)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_language(telegram_id, supabase_client, ttl))
+        _LANG_INFLIGHT[telegram_id] = task
+        task.add_done_callback(lambda _: _LANG_INFLIGHT.pop(telegram_id, None))
+
+    # Shielded so a cancelled webhook doesn't cancel the lookup other waiters share
+    return await asyncio.shield(task)
+
+@lru_cache(maxsize=8)
+def _cached_messages_class(language: str):
+    """Get the localized messages class for a language"""
+    _resolve_commands()
+    return _get_messages_class(language)
+
 async def handle_stripe_webhook(request: Request, bot: Bot, supabase_client):
     """Handle incoming Stripe webhook"""
     try:
-        # Get raw body and signature
+        # Reject unsigned requests before buffering the body
+        signature = request.headers.get('stripe-signature')
+        if not signature:
+            logger.warning("Missing webhook signature")
+            raise HTTPException(status_code=400, detail="Missing signature")
+
         body = await request.body()
-        signature = request.headers.get('stripe-signature', '')
 
         # Verify webhook signature
         if not stripe_service.verify_webhook_signature(body, signature):
@@ -28,26 +107,27 @@ async def handle_stripe_webhook(request: Request, bot: Bot, supabase_client):
             raise HTTPException(status_code=400, detail="Invalid signature")
 
         # Parse webhook event
-        event = stripe_service.parse_webhook_event(body.decode('utf-8'))
+        event = stripe_service.parse_webhook_event(body)
         if not event:
             logger.error("Failed to parse webhook event")
             raise HTTPException(status_code=400, detail="Invalid event data")
 
         # Debug logging to see what we're receiving
-        logger.info(f"Received webhook event type: {event.get('type', 'unknown')}")
-        logger.info(f"Event ID: {event.get('id', 'unknown')}")
+        logger.info("Received webhook event type: %s", event.get('type', 'unknown'))
+        logger.info("Event ID: %s", event.get('id', 'unknown'))
 
         # Log event data structure for debugging
-        event_data = event.get('data', {}).get('object', {})
-        logger.info(f"Event object keys: {list(event_data.keys()) if event_data else 'No data object'}")
+        if logger.isEnabledFor(logging.INFO):
+            event_data = event.get('data', {}).get('object', {})
+            logger.info("Event object keys: %s", list(event_data.keys()) if event_data else 'No data object')
 
-        if event_data:
-            logger.info(f"Customer ID: {event_data.get('customer', 'Not found')}")
-            logger.info(f"Metadata: {event_data.get('metadata', 'Not found')}")
+            if event_data:
+                logger.info("Customer ID: %s", event_data.get('customer', 'Not found'))
+                logger.info("Metadata: %s", event_data.get('metadata', 'Not found'))
 
         # Check if this is a subscription payment
         if not stripe_service.is_subscription_payment(event):
-            logger.info(f"Ignoring non-subscription event: {event.get('type')}")
+            logger.info("Ignoring non-subscription event: %s", event.get('type'))
             return {"status": "ignored"}
 
         # Extract customer information
@@ -70,13 +150,13 @@ async def handle_stripe_webhook(request: Request, bot: Bot, supabase_client):
         # Process the successful payment
         await process_successful_payment(bot, supabase_client, telegram_id, customer_info, event)
 
-        logger.info(f"Successfully processed payment for user {telegram_id}")
+        logger.info("Successfully processed payment for user %s", telegram_id)
         return {"status": "success"}
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error processing webhook: {e}")
+        logger.error("Error processing webhook: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 async def process_successful_payment(bot: Bot, supabase_client, telegram_id: int, customer_info: dict, event: dict):
@@ -85,7 +165,7 @@ async def process_successful_payment(bot: Bot, supabase_client, telegram_id: int
         # Get user from database
         user = await supabase_client.get_user_by_telegram_id(telegram_id)
         if not user:
-            logger.error(f"User {telegram_id} not found in database")
+            logger.error("User %s not found in database", telegram_id)
             return
 
         # Calculate subscription period
@@ -107,10 +187,10 @@ async def process_successful_payment(bot: Bot, supabase_client, telegram_id: int
         # Notify admin about new subscription
         await notify_admin_new_subscription(bot, telegram_id, customer_info)
 
-        logger.info(f"Updated subscription for user {telegram_id}")
+        logger.info("Updated subscription for user %s", telegram_id)
 
     except Exception as e:
-        logger.error(f"Error processing successful payment for user {telegram_id}: {e}")
+        logger.error("Error processing successful payment for user %s: %s", telegram_id, e)
         # Send error message to user
         await send_subscription_error_message(bot, telegram_id, supabase_client)
 
@@ -131,29 +211,17 @@ Thank you for your payment! Enjoy your premium experience."""
             parse_mode="HTML"
         )
 
-        logger.info(f"Successfully sent subscription confirmation to user {telegram_id}")
+        logger.info("Successfully sent subscription confirmation to user %s", telegram_id)
 
     except Exception as e:
-        logger.error(f"Error sending subscription success message to {telegram_id}: {e}")
+        logger.error("Error sending subscription success message to %s: %s", telegram_id, e)
 
 async def send_subscription_error_message(bot: Bot, telegram_id: int, supabase_client):
     """Send subscription error message to user"""
     try:
         # Get user language for localized message
-        from bot.commands.commands import get_user_language_async, get_messages_class
-
-        # Create a dummy message object for language detection
-        class DummyUser:
-            def __init__(self, telegram_id):
-                self.id = telegram_id
-
-        class DummyMessage:
-            def __init__(self, telegram_id):
-                self.from_user = DummyUser(telegram_id)
-
-        dummy_message = DummyMessage(telegram_id)
-        user_language = await get_user_language_async(dummy_message, supabase_client)
-        messages_class = get_messages_class(user_language)
+        user_language = await _cached_language(telegram_id, supabase_client)
+        messages_class = _cached_messages_class(user_language)
 
         # Send error message
         await bot.send_message(
@@ -163,26 +231,26 @@ async def send_subscription_error_message(bot: Bot, telegram_id: int, supabase_c
         )
 
     except Exception as e:
-        logger.error(f"Error sending subscription error message to {telegram_id}: {e}")
+        logger.error("Error sending subscription error message to %s: %s", telegram_id, e)
 
 async def notify_admin_new_subscription(bot: Bot, telegram_id: int, customer_info: dict):
     """Notify admin about new subscription"""
-    try:
-        if hasattr(Config, 'TELEGRAM_ADMIN_ID') and Config.TELEGRAM_ADMIN_ID:
-            admin_message = f"""🔥 **New Subscription!**
-
-👤 **User:** {telegram_id}
-💳 **Customer ID:** {customer_info.get('customer_id', 'N/A')}
-💰 **Amount:** ${customer_info.get('amount', customer_info.get('amount_total', 0))}
-🕐 **Time:** {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC
+    if not Config.TELEGRAM_ADMIN_ID:
+        return
 
-User now has premium access! 🚀"""
+    try:
+        admin_message = _ADMIN_TEMPLATE.format_map({
+            'telegram_id': telegram_id,
+            'customer_id': customer_info.get('customer_id', 'N/A'),
+            'amount': customer_info.get('amount', 0),
+            'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        })
 
-            await bot.send_message(
-                chat_id=Config.TELEGRAM_ADMIN_ID,
-                text=admin_message,
-                parse_mode="Markdown"
-            )
+        await bot.send_message(
+            chat_id=Config.TELEGRAM_ADMIN_ID,
+            text=admin_message,
+            parse_mode="Markdown"
+        )
 
     except Exception as e:
-        logger.error(f"Error notifying admin about new subscription: {e}")
\ No newline at end of file
+        logger.error("Error notifying admin about new subscription: %s", e)
\ No newline at end of file
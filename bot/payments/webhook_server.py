@@ -1,56 +1,62 @@
 """FastAPI server for handling Stripe webhooks"""
 
 import logging
-from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import JSONResponse
+import os
+from contextlib import asynccontextmanager
+from typing import Any
+import orjson
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import Response
 from aiogram import Bot
 from bot.config import Config
 from bot.supabase_client import SupabaseClient
 from .webhook_handler import handle_stripe_webhook
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
-# Create FastAPI app
-app = FastAPI(title="Payment Webhook Server", version="1.0.0")
+class OrjsonResponse(Response):
+    """JSON response serialized with orjson (FastAPI's ORJSONResponse is deprecated)"""
+    media_type = "application/json"
 
-# Global variables for bot and supabase client
-_bot_instance = None
-_supabase_instance = None
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
 
-def get_bot():
-    """Get bot instance"""
-    global _bot_instance
-    if _bot_instance is None:
-        _bot_instance = Bot(token=Config.TELEGRAM_BOT_TOKEN)
-    return _bot_instance
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the bot and Supabase client once per worker and release them on shutdown"""
+    app.state.bot = Bot(token=Config.TELEGRAM_BOT_TOKEN)
+    app.state.supabase = SupabaseClient(
+        supabase_url=Config.SUPABASE_URL,
+        supabase_key=Config.SUPABASE_KEY
+    )
+    try:
+        yield
+    finally:
+        # Close the bot's aiohttp session so pooled connections are not leaked
+        await app.state.bot.session.close()
+        await app.state.supabase.close()
 
-def get_supabase():
-    """Get Supabase client instance"""
-    global _supabase_instance
-    if _supabase_instance is None:
-        _supabase_instance = SupabaseClient(
-            supabase_url=Config.SUPABASE_URL,
-            supabase_key=Config.SUPABASE_KEY
-        )
-    return _supabase_instance
+# Create FastAPI app
+app = FastAPI(
+    title="Payment Webhook Server",
+    version="1.0.0",
+    default_response_class=OrjsonResponse,
+    lifespan=lifespan
+)
 
 @app.post("/webhook/stripe")
-async def stripe_webhook_endpoint(
-    request: Request,
-    bot: Bot = Depends(get_bot),
-    supabase_client: SupabaseClient = Depends(get_supabase)
-):
+async def stripe_webhook_endpoint(request: Request):
     """Stripe webhook endpoint"""
+    state = request.app.state
     try:
-        result = await handle_stripe_webhook(request, bot, supabase_client)
-        return JSONResponse(content=result, status_code=200)
+        return await handle_stripe_webhook(request, state.bot, state.supabase)
     except HTTPException as e:
-        logger.error(f"HTTP exception in webhook: {e.detail}")
+        logger.error("HTTP exception in webhook: %s", e.detail)
         raise e
     except Exception as e:
-        logger.error(f"Unexpected error in webhook: {e}")
+        logger.error("Unexpected error in webhook: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.get("/health")
@@ -77,5 +83,10 @@ if __name__ == "__main__":
         app,
         host="0.0.0.0",
         port=int(Config.WEBHOOK_PORT if hasattr(Config, 'WEBHOOK_PORT') else 8000),
-        log_level="info"
+        # "auto" picks uvloop when installed (it is not on Windows)
+        loop="auto",
+        http="httptools",
+        log_level="info",
+        # Webhooks are already logged by the handler
+        access_log=False
     )
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""Numba dot-product kernels used for similarity search when SimSIMD is not installed"""
+
+import numpy as np
+from numba import njit, prange
+
+
+# Eager signatures compile at import, so the first query never pays the JIT cost;
+# cache=True keeps the machine code on disk between restarts
+
+@njit('f4[::1](f4[:, ::1], f4[::1])', parallel=True, fastmath=True, cache=True)
+def dot_products_f32(matrix, query):
+    """Dot product of the query with every row, rows split across cores"""
+    n, d = matrix.shape
+    out = np.empty(n, dtype=np.float32)
+    for i in prange(n):
+        s = np.float32(0.0)
+        for j in range(d):
+            s += matrix[i, j] * query[j]
+        out[i] = s
+    return out
+
+
+@njit('i4[::1](i1[:, ::1], i1[::1])', parallel=True, fastmath=True, cache=True)
+def dot_products_i8(matrix, query):
+    """Integer dot product of an int8 query with every int8 row, accumulated in int32"""
+    n, d = matrix.shape
+    out = np.empty(n, dtype=np.int32)
+    for i in prange(n):
+        s = np.int32(0)
+        for j in range(d):
+            s += np.int32(matrix[i, j]) * np.int32(query[j])
+        out[i] = s
+    return out
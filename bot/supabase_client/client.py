@@ -1,21 +1,193 @@
 import asyncio
+import base64
+import logging
 import os
-from typing import List, Optional, Dict, Any
-from supabase import create_client, Client
+import time
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple
+import httpx
+import numpy as np
+import orjson
+from supabase import AsyncClient, AsyncClientOptions
 from .models import User
 
+try:
+    # SIMD dot-product kernels (AVX2/AVX-512/NEON); without it the Numba kernels
+    # below are used, then plain NumPy
+    import simsimd
+except ImportError:
+    simsimd = None
+
+_kernels = None
+if simsimd is None:
+    try:
+        # Multi-core Numba kernels, the next best thing when SimSIMD is missing
+        from . import _kernels
+    except ImportError:
+        pass
+
+logger = logging.getLogger(__name__)
+
+# Connection pool shared by every PostgREST request made through a SupabaseClient
+HTTP_POOL_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+HTTP_TIMEOUT = 120
+
+# How long the in-memory document embedding index is reused before it is reloaded
+EMBEDDING_CACHE_TTL = float(os.getenv('EMBEDDING_CACHE_TTL', '300'))
+
+# Storage precision of the cached index: 'float32' (exact), 'float16' (2x smaller, needs
+# SimSIMD with FP16 kernels) or 'int8' (4x smaller, approximate, needs SimSIMD or Numba);
+# float32 is kept when the required kernels are missing
+EMBEDDING_PRECISION = os.getenv('EMBEDDING_PRECISION', 'float32').lower()
+
+# SimSIMD capability flags of CPUs with native or F16C-assisted half-precision kernels
+_F16_CAPABILITIES = ('sapphire', 'haswell', 'neon_f16', 'sve_f16')
+
+# Optional documents column holding base64-encoded raw float32 embeddings (see encode_embedding);
+# when set it is read instead of the JSON `embedding` column
+EMBEDDING_BINARY_COLUMN = os.getenv('EMBEDDING_BINARY_COLUMN')
+
+# Name of a pgvector SQL function (see README) that ranks documents server-side;
+# when set, searches skip the in-memory index and no embeddings are transferred
+SIMILARITY_SEARCH_RPC = os.getenv('SIMILARITY_SEARCH_RPC')
+
+def encode_embedding(embedding: List[float]) -> str:
+    """Encode an embedding for EMBEDDING_BINARY_COLUMN as base64 of its raw float32 bytes"""
+    return base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode('ascii')
+
+def _parse_embedding(value: Any, binary: bool = False) -> np.ndarray:
+    """Decode a stored embedding into a float32 vector"""
+    if binary:
+        # Raw float32 bytes: a single memcpy, no number parsing
+        return np.frombuffer(base64.b64decode(value), dtype=np.float32)
+    if isinstance(value, str):
+        # JSON array string (also how pgvector values are returned)
+        value = orjson.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+def _format_automation(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the display fields of a search result from a documents row (everything but similarity)"""
+    # Get category name from the new schema
+    category_name = doc.get('category', 'Uncategorized')
+
+    # Format name as title
+    title = doc.get('name') or 'Unnamed'
+    if title.endswith('.json'):
+        title = title[:-5]  # Remove .json extension
+    title = title.replace('-', ' ').replace('_', ' ').title()
+
+    return {
+        'id': doc['id'],
+        'title': title,
+        'short_description': doc.get('short_description', ''),
+        'description': doc.get('description', ''),
+        'url': doc.get('url', ''),
+        'category': category_name,
+        'subcategory': doc.get('subcategory', ''),
+        'tags': doc.get('tags', [])
+    }
+
+def _top_k_indices(similarities: np.ndarray, limit: int, threshold: float) -> np.ndarray:
+    """Indices of the `limit` highest similarities above threshold, best first, in O(N)"""
+    if limit <= 0:
+        return np.empty(0, dtype=np.intp)
+    
+    top = np.flatnonzero(similarities > threshold)
+    if len(top) > limit:
+        # Partial selection; only the `limit` survivors are sorted
+        top = top[np.argpartition(-similarities[top], limit)[:limit]]
+    return top[np.argsort(-similarities[top])]
+
+def _quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 quantization with one scale per row; returns the quantized rows and their scales"""
+    scales = (np.abs(vectors).max(axis=-1) / 127.0).astype(np.float32)
+    quantized = np.round(vectors / scales[..., None]).astype(np.int8)
+    return np.ascontiguousarray(quantized), scales
+
+def _simsimd_supports_f16() -> bool:
+    """Whether SimSIMD can run float16 cosine kernels on this CPU"""
+    if simsimd is None:
+        return False
+    capabilities = simsimd.get_capabilities()
+    return any(capabilities.get(name) for name in _F16_CAPABILITIES)
+
+def _dot_products(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Dot product of the query with every row of the matrix"""
+    if simsimd is not None:
+        return np.asarray(simsimd.cdist(query[None, :], matrix, metric='dot'))[0]
+    if matrix.dtype == np.int8:
+        # Only built when an int8 kernel is available (see _load_embedding_index)
+        return _kernels.dot_products_i8(matrix, query)
+    if _kernels is not None:
+        return _kernels.dot_products_f32(matrix, np.ascontiguousarray(query, dtype=np.float32))
+    return matrix @ query
+
+def _cosine_similarities(matrix: np.ndarray, query: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Cosine similarity between a unit-length query and every row of a row-normalized matrix"""
+    # Row norms are divided out once when the index is built, so a plain dot product
+    # is the cosine; SimSIMD's 'cosine' metric would recompute both norms on every query
+    if matrix.dtype == np.int8:
+        query_i8, query_scale = _quantize_int8(query)
+        # Integer dot product rescaled back to the unit-length float vectors
+        return _dot_products(matrix, query_i8) * scales * query_scale
+    
+    if matrix.dtype == np.float16:
+        # Only built when SimSIMD has FP16 kernels (see _simsimd_supports_f16)
+        return _dot_products(matrix, query.astype(np.float16))
+    
+    return _dot_products(matrix, query)
+
+# Payment columns written when a payment is revoked; copied so callers can extend it
+_NO_PAYMENT_UPDATE = {'payment_status': False, 'payment_date': None}
+
+def _build_payment_update(payment_status: bool, payment_amount: Optional[float], payment_currency: Optional[str]) -> Dict[str, Any]:
+    """Build the users UPDATE payload shared by the update_user_payment_status* methods"""
+    if payment_status:
+        update_data = {'payment_status': payment_status, 'payment_date': datetime.now().isoformat()}
+    else:
+        update_data = dict(_NO_PAYMENT_UPDATE)
+    
+    if payment_amount is not None:
+        update_data['payment_amount'] = payment_amount
+    if payment_currency is not None:
+        update_data['payment_currency'] = payment_currency
+    return update_data
+
 class SupabaseClient:
     def __init__(self, supabase_url: str, supabase_key: str):
-        self.client: Client = create_client(supabase_url, supabase_key)
+        # One keep-alive HTTP/2 client so concurrent webhook bursts reuse connections
+        self._http_client = httpx.AsyncClient(http2=True, limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
+        # Native async client: queries run on the event loop instead of a thread pool.
+        # Constructed directly rather than via acreate_client, which only adds a lookup
+        # of a stored user session that a server-side key client never has.
+        self.client: AsyncClient = AsyncClient(
+            supabase_url,
+            supabase_key,
+            options=AsyncClientOptions(httpx_client=self._http_client)
+        )
+        
+        # In-memory embedding index used by search_automations_by_similarity
+        self._emb_matrix: Optional[np.ndarray] = None
+        self._emb_scales: Optional[np.ndarray] = None
+        self._emb_ids: List[Any] = []
+        self._emb_loaded_at: float = 0.0
+        self._emb_lock = asyncio.Lock()
+        # Formatted result metadata of documents that have been returned, keyed by id;
+        # cleared whenever the index is reloaded
+        self._meta_cache: Dict[Any, Dict[str, Any]] = {}
+    
+    async def close(self):
+        """Close the pooled HTTP connections"""
+        await self._http_client.aclose()
     
     async def get_user_by_telegram_id(self, telegram_id: int) -> Optional[User]:
         try:
-            # Use asyncio.to_thread to run the synchronous operation in a thread
-            response = await asyncio.to_thread(
-                lambda: self.client.table('users').select('*').eq('telegram_id', telegram_id).execute()
-            )
+            response = await self.client.table('users').select('*').eq('telegram_id', telegram_id).execute()
             if response.data:
-                return User(**response.data[0])
+                # Rows come from our own table, so skip Pydantic validation;
+                # timestamps stay as the ISO strings PostgREST returns
+                return User.model_construct(**response.data[0])
             return None
         except Exception as e:
             print(f"Error getting user: {e}")
@@ -23,24 +195,158 @@ class SupabaseClient:
     
     async def create_or_update_user(self, user_data: Dict[str, Any]) -> Optional[User]:
         try:
-            existing_user = await self.get_user_by_telegram_id(user_data['telegram_id'])
-            
-            if existing_user:
-                response = await asyncio.to_thread(
-                    lambda: self.client.table('users').update(user_data).eq('telegram_id', user_data['telegram_id']).execute()
-                )
-            else:
-                response = await asyncio.to_thread(
-                    lambda: self.client.table('users').insert(user_data).execute()
-                )
+            # Single INSERT ... ON CONFLICT (telegram_id) DO UPDATE instead of SELECT + UPDATE/INSERT
+            response = await self.client.table('users').upsert(user_data, on_conflict='telegram_id').execute()
             
             if response.data:
-                return User(**response.data[0])
+                return User.model_construct(**response.data[0])
             return None
         except Exception as e:
             print(f"Error creating/updating user: {e}")
             return None
     
+    async def _get_embedding_index(self) -> Tuple[np.ndarray, Optional[np.ndarray], List[Any]]:
+        """Return the cached embedding matrix, int8 row scales and document ids, reloading them once the TTL expires"""
+        if self._emb_matrix is not None and time.monotonic() - self._emb_loaded_at < EMBEDDING_CACHE_TTL:
+            return self._emb_matrix, self._emb_scales, self._emb_ids
+        
+        # Only one coroutine reloads the index; the others wait and reuse its result
+        async with self._emb_lock:
+            if self._emb_matrix is None or time.monotonic() - self._emb_loaded_at >= EMBEDDING_CACHE_TTL:
+                self._emb_matrix, self._emb_scales, self._emb_ids = await self._load_embedding_index()
+                self._meta_cache = {}
+                self._emb_loaded_at = time.monotonic()
+            return self._emb_matrix, self._emb_scales, self._emb_ids
+    
+    async def _load_embedding_index(self) -> Tuple[np.ndarray, Optional[np.ndarray], List[Any]]:
+        """Fetch the id and embedding of every document and stack the embeddings into a contiguous matrix"""
+        embedding_column = EMBEDDING_BINARY_COLUMN or 'embedding'
+        binary = EMBEDDING_BINARY_COLUMN is not None
+        
+        # Only what ranking needs; display columns are fetched for the top results in _fetch_meta
+        response = await self.client.table('documents').select(
+            f'id, {embedding_column}'
+        ).not_.is_(embedding_column, 'null').execute()
+        
+        ids = []
+        vectors = []
+        failed = 0
+        
+        for doc in response.data or []:
+            if doc.get(embedding_column) is None:
+                continue
+            try:
+                doc_vector = _parse_embedding(doc[embedding_column], binary)
+                if doc_vector.ndim != 1 or doc_vector.size == 0:
+                    raise ValueError(f"unexpected embedding shape {doc_vector.shape}")
+            except Exception as parse_error:
+                failed += 1
+                logger.debug("Failed to parse embedding for doc %s: %s", doc.get('id'), parse_error)
+                continue
+            
+            ids.append(doc['id'])
+            vectors.append(doc_vector)
+        
+        if failed:
+            logger.warning("Skipped %d documents with unparseable embeddings", failed)
+        
+        if not vectors:
+            return np.empty((0, 0), dtype=np.float32), None, []
+        
+        # All rows must share one dimension; keep the most common one
+        dimension = Counter(v.shape[0] for v in vectors).most_common(1)[0][0]
+        keep = [i for i, v in enumerate(vectors) if v.shape[0] == dimension]
+        if len(keep) != len(vectors):
+            logger.warning(
+                "Skipped %d documents whose embedding dimension differs from %d",
+                len(vectors) - len(keep), dimension,
+            )
+        
+        matrix = np.ascontiguousarray(np.vstack([vectors[i] for i in keep]), dtype=np.float32)
+        ids = [ids[i] for i in keep]
+        
+        # L2-normalize rows once so cosine similarity becomes a plain dot product at query time
+        norms = np.linalg.norm(matrix, axis=1)
+        nonzero = norms > 0
+        if not nonzero.all():
+            logger.warning("Skipped %d documents with zero-length embeddings", int((~nonzero).sum()))
+            matrix = np.ascontiguousarray(matrix[nonzero])
+            norms = norms[nonzero]
+            ids = [doc_id for doc_id, ok in zip(ids, nonzero) if ok]
+        matrix /= norms[:, None]
+        
+        scales = None
+        if EMBEDDING_PRECISION == 'int8':
+            # NumPy's integer matmul upcasts the whole matrix and skips BLAS, so it is
+            # several times slower than float32; quantize only with a real int8 kernel
+            if simsimd is not None or _kernels is not None:
+                matrix, scales = _quantize_int8(matrix)
+            else:
+                logger.warning("EMBEDDING_PRECISION=int8 needs SimSIMD or Numba; keeping float32")
+        elif EMBEDDING_PRECISION == 'float16':
+            if _simsimd_supports_f16():
+                matrix = matrix.astype(np.float16)
+            else:
+                logger.warning("EMBEDDING_PRECISION=float16 needs SimSIMD FP16 support; keeping float32")
+        
+        logger.debug("Cached %d automation documents with %s embeddings", len(ids), matrix.dtype)
+        return matrix, scales, ids
+    
+    async def _rank_ids(self, query_embedding: List[float], limit: int, threshold: float) -> List[Tuple[Any, float]]:
+        """Rank documents against the cached embedding index; returns (id, similarity) pairs, best first"""
+        matrix, scales, ids = await self._get_embedding_index()
+        if not ids:
+            logger.debug("No documents with embeddings found")
+            return []
+        
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        if query_vector.shape != (matrix.shape[1],):
+            logger.warning("Dimension mismatch: query=%s, documents=%d", query_vector.shape, matrix.shape[1])
+            return []
+        
+        query_norm = np.linalg.norm(query_vector)
+        if not query_norm:
+            logger.warning("Query embedding has zero length")
+            return []
+        
+        similarities = _cosine_similarities(matrix, query_vector / query_norm, scales)
+        
+        top = _top_k_indices(similarities, limit, threshold)
+        return [(ids[i], float(similarities[i])) for i in top]
+    
+    async def _fetch_meta(self, ids: List[Any]) -> Dict[Any, Dict[str, Any]]:
+        """Formatted display fields of the given documents, keyed by id; only ids not yet cached are queried"""
+        missing = [doc_id for doc_id in ids if doc_id not in self._meta_cache]
+        if missing:
+            response = await self.client.table('documents').select(
+                'id, url, short_description, description, name, category, subcategory, tags'
+            ).in_('id', missing).execute()
+            for doc in response.data or []:
+                try:
+                    self._meta_cache[doc['id']] = _format_automation(doc)
+                except Exception as format_error:
+                    logger.debug("Failed to format doc %s: %s", doc.get('id'), format_error)
+        return {doc_id: self._meta_cache[doc_id] for doc_id in ids if doc_id in self._meta_cache}
+    
+    async def _search_automations_in_memory(self, query_embedding: List[float], limit: int, threshold: float) -> List[Dict[str, Any]]:
+        """Rank ids in memory, then attach the metadata of the top results"""
+        ranked = await self._rank_ids(query_embedding, limit, threshold)
+        if not ranked:
+            return []
+        
+        meta = await self._fetch_meta([doc_id for doc_id, _ in ranked])
+        # Documents deleted since the index was loaded have no metadata and are dropped
+        return [{**meta[doc_id], 'similarity': similarity} for doc_id, similarity in ranked if doc_id in meta]
+    
+    async def _search_automations_rpc(self, query_embedding: List[float], limit: int, threshold: float) -> List[Dict[str, Any]]:
+        """Rank documents inside Postgres with the pgvector function named by SIMILARITY_SEARCH_RPC"""
+        response = await self.client.rpc(SIMILARITY_SEARCH_RPC, {
+            'query_embedding': query_embedding,
+            'match_threshold': threshold,
+            'match_count': limit
+        }).execute()
+        return [{**_format_automation(doc), 'similarity': float(doc['similarity'])} for doc in response.data or []]
+    
     async def search_automations_by_similarity(self, query_embedding: List[float], limit: int = 3, threshold: float = None) -> List[Dict[str, Any]]:
         """
         Search for similar automation documents using vector similarity
@@ -58,122 +364,28 @@ class SupabaseClient:
             threshold = float(os.getenv('SIMILARITY_THRESHOLD', '0.7'))
             
         try:
-            print(f"🔍 Searching for similar automations with threshold={threshold}, limit={limit}")
-            
-            # Get all documents with embeddings from the documents table
-            response = await asyncio.to_thread(
-                lambda: self.client.table('documents').select('''
-                    id, url, short_description, description, name,
-                    embedding, category, subcategory, tags
-                ''').not_.is_('embedding', 'null').execute()
-            )
-            
-            print(f"🔍 Raw response data count: {len(response.data) if response.data else 0}")
-            if response.data and len(response.data) > 0:
-                first_doc = response.data[0]
-                print(f"🔍 First document structure: {list(first_doc.keys())}")
-                print(f"🔍 Has embedding: {first_doc.get('embedding') is not None}")
-                if first_doc.get('embedding'):
-                    embedding_sample = first_doc.get('embedding')
-                    print(f"🔍 Embedding type: {type(embedding_sample)}, length: {len(embedding_sample) if embedding_sample else 0}")
-                    print(f"🔍 Embedding preview (first 100 chars): {str(embedding_sample)[:100]}...")
+            logger.debug("Searching for similar automations with threshold=%s, limit=%d", threshold, limit)
             
-            # Filter out documents without embeddings manually
-            if response.data:
-                response.data = [doc for doc in response.data if doc.get('embedding') is not None]
-                print(f"🔍 Documents with embeddings after filtering: {len(response.data)}")
-            
-            if not response.data:
-                print("🔍 No documents with embeddings found")
-                return []
-            
-            print(f"🔍 Retrieved {len(response.data)} automation documents with embeddings")
-            
-            # Calculate similarities manually
-            import numpy as np
-            import json
-            query_vector = np.array(query_embedding)
-            
-            doc_similarities = []
-            
-            for doc in response.data:
-                if doc.get('embedding'):
-                    try:
-                        # Parse embedding from string format (stored as JSON string)
-                        embedding_str = doc['embedding']
-                        if isinstance(embedding_str, str):
-                            # Try to parse as JSON array
-                            try:
-                                embedding_data = json.loads(embedding_str)
-                            except json.JSONDecodeError:
-                                # If not JSON, try to evaluate as Python literal
-                                embedding_data = eval(embedding_str)
-                        else:
-                            embedding_data = embedding_str
-                        
-                        doc_vector = np.array(embedding_data)
-                        
-                        if doc_vector.shape != query_vector.shape:
-                            print(f"🔍 Dimension mismatch for doc {doc.get('id')}: query={query_vector.shape}, doc={doc_vector.shape}")
-                            continue
-                            
-                    except Exception as parse_error:
-                        print(f"🔍 Failed to parse embedding for doc {doc.get('id')}: {parse_error}")
-                        continue
-                    
-                    # Cosine similarity calculation
-                    dot_product = np.dot(query_vector, doc_vector)
-                    query_norm = np.linalg.norm(query_vector)
-                    doc_norm = np.linalg.norm(doc_vector)
-                    
-                    cosine_sim = dot_product / (query_norm * doc_norm)
-                    
-                    if cosine_sim > threshold:
-                        # Get category name from the new schema
-                        category_name = doc.get('category', 'Uncategorized')
-
-                        # Format name as title
-                        title = doc.get('name', 'Unnamed')
-                        if title.endswith('.json'):
-                            title = title[:-5]  # Remove .json extension
-                        title = title.replace('-', ' ').replace('_', ' ').title()
-
-                        doc_similarities.append({
-                            'id': doc['id'],
-                            'title': title,
-                            'short_description': doc.get('short_description', ''),
-                            'description': doc.get('description', ''),
-                            'url': doc.get('url', ''),
-                            'category': category_name,
-                            'subcategory': doc.get('subcategory', ''),
-                            'tags': doc.get('tags', []),
-                            'similarity': float(cosine_sim)
-                        })
-            
-            # Sort by similarity (highest first) and limit
-            doc_similarities.sort(key=lambda x: x['similarity'], reverse=True)
-            results = doc_similarities[:limit]
+            if SIMILARITY_SEARCH_RPC:
+                results = await self._search_automations_rpc(query_embedding, limit, threshold)
+            else:
+                results = await self._search_automations_in_memory(query_embedding, limit, threshold)
             
-            print(f"🔍 Found {len(results)} similar automations above threshold {threshold}")
-            for i, doc in enumerate(results):
-                print(f"🔍 Rank {i+1}: {doc['title']} (similarity: {doc['similarity']:.4f})")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Found %d similar automations above threshold %s", len(results), threshold)
+                for i, doc in enumerate(results):
+                    logger.debug("Rank %d: %s (similarity: %.4f)", i + 1, doc['title'], doc['similarity'])
             
             return results
             
         except Exception as e:
-            print(f"Error in automation similarity search: {e}")
+            logger.error("Error in automation similarity search: %s", e)
             return []
     
     
     
     async def create_user(self, telegram_id: int, username: str = None, first_name: str = None, last_name: str = None) -> Optional[User]:
         """Create user only if doesn't exist - for handlers compatibility"""
-        # Check if user already exists
-        existing_user = await self.get_user_by_telegram_id(telegram_id)
-        if existing_user:
-            return existing_user  # Don't update, just return existing user
-
-        # Only create new user if doesn't exist
         user_data = {
             'telegram_id': telegram_id,
             'username': username
@@ -182,12 +394,13 @@ class SupabaseClient:
         user_data = {k: v for k, v in user_data.items() if v is not None}
         
         try:
-            response = await asyncio.to_thread(
-                lambda: self.client.table('users').insert(user_data).execute()
-            )
+            # INSERT ... ON CONFLICT DO NOTHING: existing users are left untouched
+            response = await self.client.table('users').upsert(user_data, on_conflict='telegram_id', ignore_duplicates=True).execute()
             if response.data:
                 return response.data[0]
-            return None
+            
+            # Nothing was inserted, so the user already exists
+            return await self.get_user_by_telegram_id(telegram_id)
         except Exception as e:
             print(f"Error creating user: {e}")
             return None
@@ -195,21 +408,9 @@ class SupabaseClient:
     async def update_user_payment_status(self, telegram_id: int, payment_status: bool, payment_amount: float = None, payment_currency: str = None) -> bool:
         """Update user payment status"""
         try:
-            from datetime import datetime
-            
-            update_data = {
-                'payment_status': payment_status,
-                'payment_date': datetime.now().isoformat() if payment_status else None
-            }
-            
-            if payment_amount is not None:
-                update_data['payment_amount'] = payment_amount
-            if payment_currency is not None:
-                update_data['payment_currency'] = payment_currency
+            update_data = _build_payment_update(payment_status, payment_amount, payment_currency)
             
-            response = await asyncio.to_thread(
-                lambda: self.client.table('users').update(update_data).eq('telegram_id', telegram_id).execute()
-            )
+            response = await self.client.table('users').update(update_data).eq('telegram_id', telegram_id).execute()
             
             if response.data:
                 print(f"✅ Updated payment status for user {telegram_id}: {payment_status}")
@@ -225,23 +426,11 @@ class SupabaseClient:
     async def update_user_payment_status_by_email(self, email: str, payment_status: bool, payment_amount: float = None, payment_currency: str = None) -> bool:
         """Update user payment status by email (if email field exists)"""
         try:
-            from datetime import datetime
-            
-            update_data = {
-                'payment_status': payment_status,
-                'payment_date': datetime.now().isoformat() if payment_status else None
-            }
-            
-            if payment_amount is not None:
-                update_data['payment_amount'] = payment_amount
-            if payment_currency is not None:
-                update_data['payment_currency'] = payment_currency
+            update_data = _build_payment_update(payment_status, payment_amount, payment_currency)
             
             # Note: This assumes you have an email field in users table
             # You might need to add email field to users table first
-            response = await asyncio.to_thread(
-                lambda: self.client.table('users').update(update_data).eq('email', email).execute()
-            )
+            response = await self.client.table('users').update(update_data).eq('email', email).execute()
             
             if response.data:
                 print(f"✅ Updated payment status for user with email {email}: {payment_status}")
@@ -270,9 +459,7 @@ class SupabaseClient:
                 print("Error: telegram_id is required for subscription update")
                 return False
 
-            response = await asyncio.to_thread(
-                lambda: self.client.table('users').update(subscription_data).eq('telegram_id', telegram_id).execute()
-            )
+            response = await self.client.table('users').update(subscription_data).eq('telegram_id', telegram_id).execute()
 
             if response.data:
                 print(f"✅ Updated subscription for user {telegram_id}: {subscription_data.get('subscription_status', 'unknown')}")
@@ -1,6 +1,6 @@
+import asyncio
 import logging
 import stripe
-import json
 from fastapi import FastAPI, Request, HTTPException
 from bot.config import Config
 from bot.supabase_client.client import SupabaseClient
@@ -8,11 +8,19 @@ from bot.supabase_client.client import SupabaseClient
 # Initialize Stripe
 stripe.api_key = Config.STRIPE_SECRET_KEY
 
+# The endpoint cannot verify anything without a signing secret, so fail at startup
+if not Config.STRIPE_WEBHOOK_SECRET:
+    raise ValueError("Missing required environment variable: STRIPE_WEBHOOK_SECRET")
+WEBHOOK_SECRET = Config.STRIPE_WEBHOOK_SECRET
+
 # Initialize Supabase client
 supabase_client = SupabaseClient(Config.SUPABASE_URL, Config.SUPABASE_KEY)
 
 app = FastAPI()
 
+# Strong references to in-flight notification tasks; the event loop only keeps weak ones
+_background_tasks = set()
+
 @app.post("/stripe-webhook")
 async def handle_stripe_webhook(request: Request):
     """Handle Stripe webhook events"""
@@ -20,15 +28,9 @@ async def handle_stripe_webhook(request: Request):
         payload = await request.body()
         sig_header = request.headers.get('stripe-signature')
         
-        if not Config.STRIPE_WEBHOOK_SECRET:
-            logging.error("STRIPE_WEBHOOK_SECRET not configured")
-            raise HTTPException(status_code=400, detail="Webhook secret not configured")
-        
         # Verify webhook signature
         try:
-            event = stripe.Webhook.construct_event(
-                payload, sig_header, Config.STRIPE_WEBHOOK_SECRET
-            )
+            event = stripe.Webhook.construct_event(payload, sig_header, WEBHOOK_SECRET)
         except ValueError as e:
             logging.error(f"Invalid payload: {e}")
             raise HTTPException(status_code=400, detail="Invalid payload")
@@ -37,16 +39,17 @@ async def handle_stripe_webhook(request: Request):
             raise HTTPException(status_code=400, detail="Invalid signature")
         
         # Handle the event
-        if event['type'] == 'checkout.session.completed':
-            session = event['data']['object']
-            await handle_successful_payment(session)
+        event_type = event['type']
+        event_object = event['data']['object']
+        
+        if event_type == 'checkout.session.completed':
+            await handle_successful_payment(event_object)
             
-        elif event['type'] == 'payment_intent.succeeded':
-            payment_intent = event['data']['object']
-            await handle_payment_intent_success(payment_intent)
+        elif event_type == 'payment_intent.succeeded':
+            await handle_payment_intent_success(event_object)
             
         else:
-            logging.info(f"Unhandled event type: {event['type']}")
+            logging.info(f"Unhandled event type: {event_type}")
         
         return {"status": "success"}
         
@@ -78,15 +81,12 @@ async def handle_successful_payment(session):
                 payment_currency=currency
             )
             
-            # Send confirmation message to user
-            from bot.main import bot
-            await bot.send_message(
-                chat_id=int(telegram_user_id),
-                text=f"✅ Платеж успешно обработан!\n\n"
-                     f"💰 Сумма: {amount_total} {currency.upper()}\n"
-                     f"📧 Email: {customer_email}\n\n"
-                     f"Спасибо за оплату! Ваш доступ к сервису активирован."
+            # Confirm to the user in the background so Stripe gets its 200 without waiting on Telegram
+            task = asyncio.create_task(
+                _notify_payment(int(telegram_user_id), amount_total, currency, customer_email)
             )
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
         elif customer_email:
             # Find user by email if telegram_user_id not available
             await supabase_client.update_user_payment_status_by_email(
@@ -101,6 +101,20 @@ async def handle_successful_payment(session):
     except Exception as e:
         logging.error(f"Error processing successful payment: {e}")
 
+async def _notify_payment(telegram_id, amount_total, currency, customer_email):
+    """Send the payment confirmation message; failures are logged, never raised"""
+    try:
+        from bot.main import bot
+        await bot.send_message(
+            chat_id=telegram_id,
+            text=f"✅ Платеж успешно обработан!\n\n"
+                 f"💰 Сумма: {amount_total} {currency.upper()}\n"
+                 f"📧 Email: {customer_email}\n\n"
+                 f"Спасибо за оплату! Ваш доступ к сервису активирован."
+        )
+    except Exception as e:
+        logging.error(f"Error sending payment confirmation to {telegram_id}: {e}")
+
 async def handle_payment_intent_success(payment_intent):
     """Handle successful payment intent"""
     try:
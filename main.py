@@ -5,19 +5,28 @@ Webhook Server Entry Point for Railway Deployment
 
 import os
 import uvicorn
-from bot.payments.webhook_server import app
 
 if __name__ == "__main__":
     # Railway automatically sets PORT environment variable
     port = int(os.getenv('PORT', 8000))
     host = os.getenv('HOST', '0.0.0.0')
 
-    print(f"Starting webhook server on {host}:{port}")
+    # Railway/Heroku convention for the number of worker processes. A small fixed
+    # default, since os.cpu_count() reports the host's CPUs inside a container
+    # and every worker opens its own Bot session and Supabase pool
+    workers = int(os.getenv('WEB_CONCURRENCY', '2'))
 
+    print(f"Starting webhook server on {host}:{port} with {workers} workers")
+
+    # The app is passed as an import string so uvicorn can spawn worker processes
     uvicorn.run(
-        app,
+        "bot.payments.webhook_server:app",
         host=host,
         port=port,
+        workers=workers,
+        # "auto" picks uvloop when installed (it is not on Windows)
+        loop="auto",
+        http="httptools",
         log_level="info",
         access_log=True
     )
\ No newline at end of file